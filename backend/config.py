@@ -5,6 +5,8 @@ import os
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3")
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))  # concurrent embedding requests
+EMBED_MAX_TOKENS = int(os.getenv("EMBED_MAX_TOKENS", "2048"))  # embedding model context window
 
 # File processing settings
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
@@ -24,11 +26,32 @@ SUPPORTED_EXTENSIONS = {
     # Documents
     '.pdf',
 }
+# Lowercase suffixes for a single str.endswith() check per file name
+SUPPORTED_EXTENSIONS_TUPLE = tuple(ext.lower() for ext in SUPPORTED_EXTENSIONS)
 
 # Indexing settings
 CHUNK_SIZE = 1000  # characters per chunk
 CHUNK_OVERLAP = 200  # overlap between chunks
-BATCH_SIZE = 32  # batch size for embedding
+BATCH_SIZE = 256  # chunks collected across files per embed_batch call
+INDEX_LOADER_WORKERS = int(os.getenv("INDEX_LOADER_WORKERS", str(os.cpu_count() or 1)))  # processes extracting/chunking files
+INDEX_QUEUE_SIZE = 64  # max files being extracted or waiting to be embedded
+
+# FAISS index settings
+# OpenMP threads used by FAISS. Exported before faiss is imported so the
+# runtime starts with this pool size instead of one thread per core
+FAISS_NUM_THREADS = int(os.getenv("OMP_NUM_THREADS", str(min(8, os.cpu_count() or 1))))
+os.environ.setdefault("OMP_NUM_THREADS", str(FAISS_NUM_THREADS))
+# Vector storage: "fp16" (half the RAM, negligible recall loss), "8bit" or "none" (fp32)
+FAISS_SCALAR_QUANTIZER = os.getenv("FAISS_SCALAR_QUANTIZER", "fp16")
+HNSW_MIN_VECTORS = 10_000  # switch from exact search to HNSW above this many chunks
+HNSW_M = 32  # graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # raised to 4 * top_k for larger result sets
+IVF_MIN_VECTORS = 1_000_000  # switch from HNSW to IVF above this many chunks
+IVF_NPROBE = 16  # inverted lists visited per query
+# Memory-map saved IVF indexes on load instead of reading them into RAM.
+# Off by default on Windows, where a mapped file cannot be replaced on save
+FAISS_MMAP_INDEX = os.getenv("FAISS_MMAP_INDEX", "false" if os.name == "nt" else "true").lower() == "true"
 
 # Storage paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
@@ -42,3 +65,6 @@ os.makedirs(METADATA_DIR, exist_ok=True)
 # Search settings
 TOP_K_RESULTS = 20
 SIMILARITY_THRESHOLD = 0.4  # Minimum similarity score (0-1). Higher = more strict
+QUERY_CACHE_SIZE = 1024  # query embeddings kept for repeated searches
+SEARCH_BATCH_SIZE = 16  # max concurrent queries coalesced into one FAISS search
+SEARCH_BATCH_WAIT_MS = 5  # how long the first query waits for others to join its batch
@@ -1,12 +1,17 @@
 """Indexer for managing file indexing and vector storage."""
 import os
-import json
+import gzip
+import shutil
 import logging
 import hashlib
-from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Dict, Iterator, Optional, Tuple
 import numpy as np
 import faiss
+import orjson
 
 from utils.file_processor import FileProcessor
 from utils.ollama_client import OllamaClient
@@ -14,6 +19,38 @@ import config
 
 logger = logging.getLogger(__name__)
 
+_IGNORED_DIRS = frozenset({'node_modules', '__pycache__', 'venv', 'env', '.git'})
+
+# Exact technical terms that boost a result when present in both query and chunk
+_TECHNICAL_PATTERNS = (
+    ('const ', 5.0),
+    ('function ', 5.0),
+    ('class ', 5.0),
+    ('= {', 3.0),  # Object literal
+    ('=>', 3.0),   # Arrow function
+    ('import ', 2.0),
+    ('export ', 2.0),
+)
+_CODE_INDICATORS = ('function', 'const', 'let', 'var', 'class', 'method',
+                    'define', 'declaration', 'implementation', 'object')
+_CODE_EXTENSIONS = frozenset({'.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.go', '.rs'})
+_STYLE_EXTENSIONS = frozenset({'.css', '.scss', '.sass', '.less'})
+
+# config.FAISS_SCALAR_QUANTIZER values; anything else keeps full fp32 vectors
+_SCALAR_QUANTIZERS = {
+    'fp16': faiss.ScalarQuantizer.QT_fp16,
+    '8bit': faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def _load_file(file_path: str) -> Tuple[Optional[str], List[Tuple[int, int]]]:
+    """Extract and chunk one file; runs in a worker process, so it must stay module-level."""
+    # Each file is read once per run, so don't fill the worker's PDF cache
+    text_content = FileProcessor.extract_text_from_file(file_path, use_cache=False)
+    if text_content is None or not text_content.strip():
+        return text_content, []
+    return text_content, FileProcessor.chunk_offsets(text_content, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+
 
 class FileIndexer:
     """Manages file indexing and vector storage using FAISS."""
@@ -23,26 +60,68 @@ class FileIndexer:
         self.file_processor = FileProcessor()
         self.index = None
         self.metadata = []
+        # Distinct file paths in metadata, kept in step so stats stay O(1)
+        self._unique_files = set()
         self.dimension = None
         self.indexed_directory = None
+        # Embedding model the current vectors were produced with
+        self.embedding_model = None
+        # Saved index file the current index is memory-mapped from, if any
+        self._mmap_path = None
+        # (embedding model, enriched query) -> embedding, in LRU order
+        self._query_cache: OrderedDict = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # file_path -> ((mtime_ns, size), hash); stat change invalidates the entry
+        self._hash_cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
         
     def _get_file_hash(self, file_path: str) -> str:
         """Generate hash of file for change detection."""
         try:
+            stat = os.stat(file_path)
+            cached = self._hash_cache.get(file_path)
+            if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+                return cached[1]
+            
+            # Stream the file in 1 MiB blocks instead of reading it whole
+            file_hash = hashlib.blake2b(digest_size=16)
             with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+                while buf := f.read(1 << 20):
+                    file_hash.update(buf)
+            
+            digest = file_hash.hexdigest()
+            self._hash_cache[file_path] = ((stat.st_mtime_ns, stat.st_size), digest)
+            return digest
         except Exception:
             return ""
     
-    def _should_index_file(self, file_path: str) -> bool:
+    def _iter_loaded_files(self, executor: ProcessPoolExecutor,
+                           files_to_index: List[Tuple[str, int, int]]) -> Iterator[Tuple]:
+        """Yield ((path, size, mtime_ns), text, chunk offsets, error) as worker processes finish files."""
+        pending = iter(files_to_index)
+        in_flight = {}
+        
+        # Keep a bounded window of files in flight so loaded text never piles up
+        for file_entry in itertools.islice(pending, config.INDEX_QUEUE_SIZE):
+            in_flight[executor.submit(_load_file, file_entry[0])] = file_entry
+        
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_entry = in_flight.pop(future)
+                
+                # Refill before handing back, so workers stay busy while we embed
+                next_file = next(pending, None)
+                if next_file is not None:
+                    in_flight[executor.submit(_load_file, next_file[0])] = next_file
+                
+                try:
+                    text_content, chunks = future.result()
+                    yield file_entry, text_content, chunks, None
+                except Exception as e:
+                    yield file_entry, None, [], e
+    
+    def _should_index_file(self, file_path: str, file_size: int) -> bool:
         """Check if file should be indexed."""
-        file_ext = Path(file_path).suffix.lower()
-        file_size = os.path.getsize(file_path)
-        
-        # Check extension
-        if file_ext not in config.SUPPORTED_EXTENSIONS:
-            return False
-        
         # Check size
         if file_size > config.MAX_FILE_SIZE_BYTES:
             logger.warning(f"Skipping large file: {file_path} ({file_size / 1024 / 1024:.2f} MB)")
@@ -54,24 +133,40 @@ class FileIndexer:
         
         return True
     
-    def scan_directory(self, directory: str) -> List[str]:
-        """Scan directory and return list of files to index."""
-        files_to_index = []
-        
-        for root, dirs, files in os.walk(directory):
-            # Skip hidden directories and common ignore patterns
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in 
-                      ['node_modules', '__pycache__', 'venv', 'env', '.git']]
-            
-            for file in files:
-                if file.startswith('.'):
-                    continue
-                
-                file_path = os.path.join(root, file)
-                if self._should_index_file(file_path):
-                    files_to_index.append(file_path)
-        
-        return files_to_index
+    def _walk_directory(self, directory: str) -> Iterator[Tuple[str, int, int]]:
+        """Recursively yield (path, size, mtime_ns) for candidate files using one stat per file."""
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Skip hidden files/directories and common ignore patterns
+                    if entry.name.startswith('.'):
+                        continue
+                    
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in _IGNORED_DIRS:
+                                yield from self._walk_directory(entry.path)
+                            continue
+                        
+                        if not entry.is_file():
+                            continue
+                        
+                        # Check extension before paying for a stat
+                        if not entry.name.lower().endswith(config.SUPPORTED_EXTENSIONS_TUPLE):
+                            continue
+                        
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    
+                    if self._should_index_file(entry.path, stat.st_size):
+                        yield entry.path, stat.st_size, stat.st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Could not scan directory {directory}: {e}")
+    
+    def scan_directory(self, directory: str) -> List[Tuple[str, int, int]]:
+        """Scan directory and return list of (path, size, mtime_ns) for files to index."""
+        return list(self._walk_directory(directory))
     
     def index_directory(self, directory: str, progress_callback=None) -> Dict:
         """Index all files in a directory with batch processing."""
@@ -93,9 +188,26 @@ class FileIndexer:
         
         logger.info(f"Found {total_files} files to index")
         
-        # Reset index
-        self.metadata = []
-        all_embeddings = []
+        # Carry over vectors of files that are unchanged since the last run
+        previous_total = len(self.metadata)
+        reused_ids, reused_metadata, files_to_load = self._split_unchanged(files_to_index)
+        emb_buf = self._reconstruct(reused_ids) if reused_ids else None
+        if reused_ids and emb_buf is None:
+            logger.warning("Could not reuse stored vectors, re-indexing all files")
+            reused_ids, reused_metadata, files_to_load = [], [], files_to_index
+        
+        unchanged_count = total_files - len(files_to_load)
+        if unchanged_count:
+            logger.info(f"Reusing {len(reused_ids)} chunks from {unchanged_count} unchanged files")
+            if progress_callback:
+                progress_callback(unchanged_count, total_files, reused_metadata[-1]['file_path'])
+        
+        # The new metadata is built locally and swapped in together with the
+        # new index, so a failed run leaves the current index consistent
+        metadata = list(reused_metadata)
+        # Embeddings are written into one contiguous (capacity, d) float32
+        # buffer that grows geometrically; rows [:num_embedded] are filled
+        num_embedded = len(reused_ids)
         indexed_count = 0
         failed_count = 0
         skipped_count = 0
@@ -104,75 +216,77 @@ class FileIndexer:
         batch_chunks = []
         batch_metadata_temp = []
         
-        for idx, file_path in enumerate(files_to_index):
-            try:
-                # Extract text
-                text_content = self.file_processor.extract_text_from_file(file_path)
-                if text_content is None:
-                    logger.warning(f"Could not extract text: {file_path}")
-                    skipped_count += 1
-                    if progress_callback:
-                        progress_callback(idx + 1, total_files, file_path)
-                    continue
+        # Worker processes extract and chunk files ahead of the embedding loop,
+        # so PDF parsing runs on all cores and overlaps with Ollama round-trips
+        processed_count = unchanged_count
+        
+        with ProcessPoolExecutor(max_workers=max(1, min(config.INDEX_LOADER_WORKERS, len(files_to_load) or 1))) as executor:
+            for file_entry, text_content, chunks, error in self._iter_loaded_files(executor, files_to_load):
+                file_path, file_size, file_mtime_ns = file_entry
+                processed_count += 1
+                
+                try:
+                    if error is not None:
+                        raise error
+                    
+                    if text_content is None:
+                        logger.warning(f"Could not extract text: {file_path}")
+                        skipped_count += 1
+                        if progress_callback:
+                            progress_callback(processed_count, total_files, file_path)
+                        continue
+                        
+                    if not chunks:
+                        logger.warning(f"Empty content: {file_path}")
+                        skipped_count += 1
+                        if progress_callback:
+                            progress_callback(processed_count, total_files, file_path)
+                        continue
                     
-                if not text_content.strip():
-                    logger.warning(f"Empty content: {file_path}")
-                    skipped_count += 1
+                    file_hash = self._get_file_hash(file_path)
+                    
+                    # Add chunks to batch
+                    for chunk_idx, (chunk_start, chunk_end) in enumerate(chunks):
+                        batch_chunks.append(text_content[chunk_start:chunk_end])
+                        batch_metadata_temp.append({
+                            'file_path': file_path,
+                            'file_name': os.path.basename(file_path),
+                            'chunk_index': chunk_idx,
+                            'total_chunks': len(chunks),
+                            'chunk_start': chunk_start,
+                            'chunk_end': chunk_end,
+                            'file_size': file_size,
+                            'file_mtime_ns': file_mtime_ns,
+                            'file_hash': file_hash,
+                        })
+                    
+                    # Process batch when it reaches BATCH_SIZE
+                    if len(batch_chunks) >= config.BATCH_SIZE:
+                        embeddings = self.ollama_client.embed_batch(batch_chunks)
+                        emb_buf, num_embedded = self._store_embeddings(
+                            emb_buf, num_embedded, embeddings, batch_metadata_temp, metadata
+                        )
+                        batch_chunks = []
+                        batch_metadata_temp = []
+                    
+                    indexed_count += 1
+                    
+                    # Progress callback
                     if progress_callback:
-                        progress_callback(idx + 1, total_files, file_path)
-                    continue
-                
-                # Chunk text
-                chunks = self.file_processor.chunk_text(
-                    text_content, 
-                    config.CHUNK_SIZE, 
-                    config.CHUNK_OVERLAP
-                )
-                
-                file_info = self.file_processor.get_file_info(file_path)
-                
-                # Add chunks to batch
-                for chunk_idx, chunk in enumerate(chunks):
-                    batch_chunks.append(chunk)
-                    batch_metadata_temp.append({
-                        'file_path': file_path,
-                        'file_name': os.path.basename(file_path),
-                        'chunk_index': chunk_idx,
-                        'total_chunks': len(chunks),
-                        'chunk_text': chunk,
-                        'file_size': file_info.get('size', 0),
-                        'file_hash': self._get_file_hash(file_path),
-                    })
-                
-                # Process batch when it reaches BATCH_SIZE
-                if len(batch_chunks) >= config.BATCH_SIZE:
-                    embeddings = self.ollama_client.embed_batch(batch_chunks)
-                    for emb, meta in zip(embeddings, batch_metadata_temp):
-                        if emb is not None:
-                            all_embeddings.append(emb)
-                            self.metadata.append(meta)
-                    batch_chunks = []
-                    batch_metadata_temp = []
-                
-                indexed_count += 1
-                
-                # Progress callback
-                if progress_callback:
-                    progress_callback(idx + 1, total_files, file_path)
-                
-            except Exception as e:
-                logger.error(f"Error indexing file {file_path}: {e}")
-                failed_count += 1
+                        progress_callback(processed_count, total_files, file_path)
+                    
+                except Exception as e:
+                    logger.error(f"Error indexing file {file_path}: {e}")
+                    failed_count += 1
         
         # Process remaining chunks
         if batch_chunks:
             embeddings = self.ollama_client.embed_batch(batch_chunks)
-            for emb, meta in zip(embeddings, batch_metadata_temp):
-                if emb is not None:
-                    all_embeddings.append(emb)
-                    self.metadata.append(meta)
+            emb_buf, num_embedded = self._store_embeddings(
+                emb_buf, num_embedded, embeddings, batch_metadata_temp, metadata
+            )
         
-        if not all_embeddings:
+        if num_embedded == 0:
             return {
                 'success': False,
                 'total_files': total_files,
@@ -182,31 +296,205 @@ class FileIndexer:
                 'message': 'No files were successfully indexed'
             }
         
-        # Create FAISS index
-        embeddings_array = np.array(all_embeddings, dtype=np.float32)
-        self.dimension = embeddings_array.shape[1]
-        
-        # Use IndexFlatIP for inner product (cosine similarity with normalized vectors)
-        self.index = faiss.IndexFlatIP(self.dimension)
-        
-        # Normalize vectors for cosine similarity
-        faiss.normalize_L2(embeddings_array)
-        self.index.add(embeddings_array)
-        
+        # Nothing added or removed: the existing index already matches
+        if num_embedded == len(reused_ids) == previous_total:
+            logger.info("No changes detected, keeping existing index")
+            index = self.index
+        else:
+            # Create FAISS index from the already-normalized vectors
+            index = self._build_index(emb_buf[:num_embedded])
+        
+        # Only now, with everything built, replace the index and its metadata
+        unique_files = {meta['file_path'] for meta in metadata}
+        if index is not self.index:
+            self._mmap_path = None
+        self.index, self.metadata, self._unique_files = index, metadata, unique_files
+        self.dimension = index.d
         self.indexed_directory = directory
+        self.embedding_model = self.ollama_client.embedding_model
         
-        logger.info(f"Indexing complete. Indexed {indexed_count}/{total_files} files")
+        logger.info(f"Indexing complete. Indexed {indexed_count}/{total_files} files ({unchanged_count} unchanged)")
         
         return {
             'success': True,
             'total_files': total_files,
             'indexed_files': indexed_count,
+            'unchanged_files': unchanged_count,
             'failed_files': failed_count,
             'skipped_files': skipped_count,
             'total_chunks': len(self.metadata),
-            'message': f'Successfully indexed {indexed_count} files ({skipped_count} skipped, {failed_count} failed)'
+            'message': f'Successfully indexed {indexed_count} files ({unchanged_count} unchanged, {skipped_count} skipped, {failed_count} failed)'
         }
     
+    def _split_unchanged(self, files_to_index: List[Tuple[str, int, int]]) -> Tuple[List[int], List[Dict], List[Tuple[str, int, int]]]:
+        """Split scanned files into reusable index rows and files that need (re)loading."""
+        if self.index is None or self.embedding_model != self.ollama_client.embedding_model:
+            return [], [], files_to_index
+        # 8-bit codes are decoded on a min/max grid that is retrained on every
+        # build, so reused vectors would gain rounding error on each re-index
+        if config.FAISS_SCALAR_QUANTIZER == '8bit':
+            return [], [], files_to_index
+        
+        # file_path -> row ids of its chunks in the current index
+        known_rows: Dict[str, List[int]] = {}
+        for row, meta in enumerate(self.metadata):
+            known_rows.setdefault(meta['file_path'], []).append(row)
+        
+        reused_ids = []
+        files_to_load = []
+        for file_entry in files_to_index:
+            file_path, file_size, file_mtime_ns = file_entry
+            rows = known_rows.get(file_path)
+            if rows is None:
+                files_to_load.append(file_entry)
+                continue
+            
+            known = self.metadata[rows[0]]
+            if known['file_size'] != file_size:
+                files_to_load.append(file_entry)
+                continue
+            
+            # Same size and mtime means unchanged without reading the file;
+            # otherwise fall back to comparing content hashes
+            if known.get('file_mtime_ns') != file_mtime_ns:
+                if known.get('file_hash') != self._get_file_hash(file_path):
+                    files_to_load.append(file_entry)
+                    continue
+                for row in rows:
+                    self.metadata[row]['file_mtime_ns'] = file_mtime_ns
+            
+            reused_ids.extend(rows)
+        
+        # Keep rows in their existing order so an unchanged index can be kept as-is
+        reused_ids.sort()
+        return reused_ids, [self.metadata[row] for row in reused_ids], files_to_load
+    
+    def _reconstruct(self, ids: List[int]) -> Optional[np.ndarray]:
+        """Recover the stored vectors for rows of the current index, re-normalized."""
+        try:
+            if isinstance(self.index, faiss.IndexIVF):
+                self.index.make_direct_map()
+            vectors = np.ascontiguousarray(
+                self.index.reconstruct_batch(np.asarray(ids, dtype=np.int64)),
+                dtype=np.float32
+            )
+            # fp16 decoding leaves norms slightly off 1. Re-normalizing moves
+            # values by well under one fp16 step, so re-encoding rounds them
+            # back onto the same grid rather than accumulating error per run
+            faiss.normalize_L2(vectors)
+            return vectors
+        except Exception as e:
+            logger.error(f"Error reconstructing vectors: {e}")
+            return None
+    
+    def _store_embeddings(self, emb_buf: Optional[np.ndarray], num_embedded: int,
+                          embeddings: List[Optional[List[float]]],
+                          batch_metadata: List[Dict], metadata: List[Dict]) -> Tuple[np.ndarray, int]:
+        """Write a batch of normalized embeddings into the contiguous buffer, growing it as needed.
+        
+        Metadata of the stored rows is appended to metadata, in row order.
+        """
+        valid = [(emb, meta) for emb, meta in zip(embeddings, batch_metadata) if emb is not None]
+        if not valid:
+            return emb_buf, num_embedded
+        
+        if emb_buf is None:
+            emb_buf = np.empty((max(config.BATCH_SIZE, len(valid)), len(valid[0][0])), dtype=np.float32)
+        
+        end = num_embedded + len(valid)
+        if end > emb_buf.shape[0]:
+            grown = np.empty((max(end, emb_buf.shape[0] * 2), emb_buf.shape[1]), dtype=np.float32)
+            grown[:num_embedded] = emb_buf[:num_embedded]
+            emb_buf = grown
+        
+        batch_vectors = emb_buf[num_embedded:end]
+        batch_vectors[:] = np.asarray([emb for emb, _ in valid], dtype=np.float32)
+        
+        # Normalize for cosine similarity as vectors arrive, so the finished
+        # matrix never needs a separate full pass
+        norms = np.linalg.norm(batch_vectors, axis=1, keepdims=True)
+        np.divide(batch_vectors, norms, out=batch_vectors, where=norms > 0)
+        metadata.extend(meta for _, meta in valid)
+        return emb_buf, end
+    
+    def _build_index(self, embeddings_array: np.ndarray) -> faiss.Index:
+        """Build an inner-product index sized to the number of vectors."""
+        num_vectors, dimension = embeddings_array.shape
+        qtype = _SCALAR_QUANTIZERS.get(config.FAISS_SCALAR_QUANTIZER)
+        metric = faiss.METRIC_INNER_PRODUCT
+        
+        if num_vectors > config.IVF_MIN_VECTORS:
+            # Inverted lists over a flat coarse quantizer for very large corpora
+            nlist = int(4 * np.sqrt(num_vectors))
+            quantizer = faiss.IndexFlatIP(dimension)
+            if qtype is not None:
+                index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, qtype, metric)
+            else:
+                index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+            index.nprobe = config.IVF_NPROBE
+            logger.info(f"Building IVF index ({nlist} lists) for {num_vectors} vectors")
+        elif num_vectors > config.HNSW_MIN_VECTORS:
+            if qtype is not None:
+                index = faiss.IndexHNSWSQ(dimension, qtype, config.HNSW_M, metric)
+            else:
+                index = faiss.IndexHNSWFlat(dimension, config.HNSW_M, metric)
+            index.hnsw.efConstruction = config.HNSW_EF_CONSTRUCTION
+            logger.info(f"Building HNSW index for {num_vectors} vectors")
+        elif qtype is not None:
+            # Exhaustive inner-product search over quantized codes
+            index = faiss.IndexScalarQuantizer(dimension, qtype, metric)
+        else:
+            # Use IndexFlatIP for inner product (cosine similarity with normalized vectors)
+            index = faiss.IndexFlatIP(dimension)
+        
+        # Scalar quantizers and IVF need the value ranges / centroids first
+        if not index.is_trained:
+            index.train(embeddings_array)
+        index.add(embeddings_array)
+        return index
+    
+    def _configure_search(self, top_k: int) -> None:
+        """Set per-query search parameters for approximate indexes."""
+        if isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = max(config.HNSW_EF_SEARCH, top_k * 4)
+        elif isinstance(self.index, faiss.IndexIVF):
+            self.index.nprobe = config.IVF_NPROBE
+    
+    def _is_file_unchanged(self, metadata: Dict) -> bool:
+        """Check whether a file still has the content it was indexed with."""
+        try:
+            stat = os.stat(metadata['file_path'])
+        except OSError:
+            return False
+        
+        if stat.st_size != metadata['file_size']:
+            return False
+        # A new mtime alone (e.g. touch) is settled by the content hash
+        if stat.st_mtime_ns != metadata.get('file_mtime_ns'):
+            return self._get_file_hash(metadata['file_path']) == metadata.get('file_hash')
+        return True
+    
+    def _get_chunk_text(self, metadata: Dict, file_texts: Dict[str, Optional[str]]) -> str:
+        """Re-extract a chunk's text from its file using the stored offsets."""
+        # Indexes saved before offsets were introduced still carry the text
+        if 'chunk_text' in metadata:
+            return metadata['chunk_text']
+        
+        file_path = metadata['file_path']
+        if file_path not in file_texts:
+            if self._is_file_unchanged(metadata):
+                file_texts[file_path] = self.file_processor.extract_text_from_file(file_path)
+            else:
+                # The offsets describe the indexed content; slicing an edited
+                # (or deleted) file would show and boost unrelated text
+                logger.warning(f"File changed since indexing, omitting chunk text: {file_path}")
+                file_texts[file_path] = None
+        
+        text_content = file_texts[file_path]
+        if text_content is None:
+            return ""
+        return text_content[metadata['chunk_start']:metadata['chunk_end']]
+    
     def _enrich_query(self, query: str) -> str:
         """Enrich query with technical context for better semantic matching."""
         query_lower = query.lower()
@@ -227,100 +515,142 @@ class FileIndexer:
             return f"{query} {' '.join(enrichments)}"
         return query
     
-    def _calculate_keyword_boost(self, query: str, chunk_text: str) -> float:
+    def _calculate_keyword_boost(self, active_patterns: List[Tuple[str, float]], chunk_text: str) -> float:
         """Calculate boost score based on exact keyword matches."""
-        query_lower = query.lower()
+        if not active_patterns:
+            return 0.0
+        
         chunk_lower = chunk_text.lower()
         boost = 0.0
         
         # Boost for exact technical term matches
-        technical_patterns = [
-            ('const ', 5.0),
-            ('function ', 5.0),
-            ('class ', 5.0),
-            ('= {', 3.0),  # Object literal
-            ('=>', 3.0),   # Arrow function
-            ('import ', 2.0),
-            ('export ', 2.0),
-        ]
-        
-        for pattern, score in technical_patterns:
-            if pattern in query_lower and pattern in chunk_lower:
+        for pattern, score in active_patterns:
+            if pattern in chunk_lower:
                 boost += score
         
         return boost
     
-    def _get_file_type_weight(self, file_path: str, query: str) -> float:
+    def _get_file_type_weight(self, file_path: str, is_code_query: bool) -> float:
         """Weight results based on file type relevance to query."""
-        ext = os.path.splitext(file_path)[1].lower()
-        query_lower = query.lower()
-        
         # For code-related queries, boost code files over style files
-        code_indicators = ['function', 'const', 'let', 'var', 'class', 'method', 
-                          'define', 'declaration', 'implementation', 'object']
-        
-        is_code_query = any(indicator in query_lower for indicator in code_indicators)
-        
         if is_code_query:
+            ext = os.path.splitext(file_path)[1].lower()
+            
             # Code files get higher weight
-            code_extensions = {'.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.go', '.rs'}
-            if ext in code_extensions:
+            if ext in _CODE_EXTENSIONS:
                 return 1.15  # 15% boost
             
             # Style/config files get lower weight for code queries
-            style_extensions = {'.css', '.scss', '.sass', '.less'}
-            if ext in style_extensions:
+            if ext in _STYLE_EXTENSIONS:
                 return 0.85  # 15% penalty
         
         return 1.0  # No adjustment
     
-    def search(self, query: str, top_k: int = None) -> List[Dict]:
-        """Search for files matching the query with enhanced semantic understanding."""
-        if self.index is None or len(self.metadata) == 0:
-            return []
-        
-        if top_k is None:
-            top_k = config.TOP_K_RESULTS
-        
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Enrich a query and generate its (unnormalized) embedding."""
         # Enrich query for better semantic matching
         enriched_query = self._enrich_query(query)
         logger.info(f"Original query: '{query}'")
         if enriched_query != query:
             logger.info(f"Enriched query: '{enriched_query}'")
         
+        # Repeated queries (re-renders, pagination) skip the Ollama round-trip
+        cache_key = (self.ollama_client.embedding_model, enriched_query)
+        with self._query_cache_lock:
+            cached = self._query_cache.get(cache_key)
+            if cached is not None:
+                self._query_cache.move_to_end(cache_key)
+                return list(cached)
+        
         # Generate query embedding
         query_embedding = self.ollama_client.embed_text(enriched_query)
         if query_embedding is None:
             logger.error("Failed to generate query embedding")
+            return None
+        
+        with self._query_cache_lock:
+            self._query_cache[cache_key] = tuple(query_embedding)
+            if len(self._query_cache) > config.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return query_embedding
+    
+    def search_vectors(self, query_embeddings: List[List[float]], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Run one FAISS search for a batch of query embeddings."""
+        if self.index is None or self.index.ntotal == 0:
+            empty = np.empty((len(query_embeddings), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        
+        # Stack into one (B, d) matrix so FAISS parallelizes across the batch
+        query_vectors = np.asarray(query_embeddings, dtype=np.float32)
+        if query_vectors.shape[1] != self.index.d:
+            logger.error(f"Query dimension {query_vectors.shape[1]} does not match index dimension {self.index.d}")
+            empty = np.empty((len(query_embeddings), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        faiss.normalize_L2(query_vectors)
+        
+        k = min(top_k, self.index.ntotal)
+        self._configure_search(k)
+        return self.index.search(query_vectors, k)
+    
+    def search(self, query: str, top_k: int = None) -> List[Dict]:
+        """Search for files matching the query with enhanced semantic understanding."""
+        if self.index is None or len(self.metadata) == 0:
+            return []
+        
+        if top_k is None:
+            top_k = config.TOP_K_RESULTS
+        
+        query_embedding = self.embed_query(query)
+        if query_embedding is None:
             return []
         
         # Normalize query vector
         query_vector = np.array([query_embedding], dtype=np.float32)
+        if query_vector.shape[1] != self.index.d:
+            logger.error(f"Query dimension {query_vector.shape[1]} does not match index dimension {self.index.d}")
+            return []
         faiss.normalize_L2(query_vector)
         
         # Search
-        distances, indices = self.index.search(query_vector, min(top_k, self.index.ntotal))
+        k = min(top_k, self.index.ntotal)
+        self._configure_search(k)
+        distances, indices = self.index.search(query_vector, k)
+        
+        return self.rank_results(query, distances[0], indices[0])
+    
+    def rank_results(self, query: str, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        """Turn raw FAISS hits for one query into weighted, per-file results."""
+        # Query-level analysis done once, not per result
+        query_lower = query.lower()
+        active_patterns = [(pattern, score) for pattern, score in _TECHNICAL_PATTERNS
+                           if pattern in query_lower]
+        is_code_query = any(indicator in query_lower for indicator in _CODE_INDICATORS)
         
         # Compile results
         results = []
         seen_files = set()
+        # Extracted text per file, so each hit file is read at most once
+        file_texts = {}
         
-        for dist, idx in zip(distances[0], indices[0]):
+        for dist, idx in zip(distances, indices):
             if idx < 0 or idx >= len(self.metadata):
                 continue
             
             metadata = self.metadata[idx]
             file_path = metadata['file_path']
-            chunk_text = metadata['chunk_text']
+            chunk_text = None
             
             # Calculate base similarity score (0-100)
             base_similarity = float(dist) * 100
             
             # Apply file type weighting
-            file_type_weight = self._get_file_type_weight(file_path, query)
+            file_type_weight = self._get_file_type_weight(file_path, is_code_query)
             
             # Apply keyword boost
-            keyword_boost = self._calculate_keyword_boost(query, chunk_text)
+            keyword_boost = 0.0
+            if active_patterns:
+                chunk_text = self._get_chunk_text(metadata, file_texts)
+                keyword_boost = self._calculate_keyword_boost(active_patterns, chunk_text)
             
             # Calculate final similarity with adjustments
             similarity = min(base_similarity * file_type_weight + keyword_boost, 100.0)
@@ -333,6 +663,8 @@ class FileIndexer:
             # Group by file - keep best chunk per file
             if file_path not in seen_files:
                 seen_files.add(file_path)
+                if chunk_text is None:
+                    chunk_text = self._get_chunk_text(metadata, file_texts)
                 
                 results.append({
                     'file_path': file_path,
@@ -357,18 +689,32 @@ class FileIndexer:
                 return False
             
             index_path = os.path.join(config.FAISS_INDEX_DIR, f"{index_name}.index")
-            metadata_path = os.path.join(config.METADATA_DIR, f"{index_name}.json")
+            metadata_path = os.path.join(config.METADATA_DIR, f"{index_name}.json.gz")
             
-            # Save FAISS index
-            faiss.write_index(self.index, index_path)
+            # A memory-mapped IVF index holds on-disk inverted lists, and
+            # write_index would store only a reference to the mapped file.
+            # It is unchanged since loading, so keep or copy that file instead
+            if self._mmap_path is not None:
+                if os.path.abspath(self._mmap_path) != os.path.abspath(index_path):
+                    tmp_index_path = f"{index_path}.tmp"
+                    shutil.copyfile(self._mmap_path, tmp_index_path)
+                    os.replace(tmp_index_path, index_path)
+            else:
+                # Save FAISS index. Write to a temp file and rename so an index
+                # currently memory-mapped from index_path is never truncated
+                tmp_index_path = f"{index_path}.tmp"
+                faiss.write_index(self.index, tmp_index_path)
+                os.replace(tmp_index_path, index_path)
             
-            # Save metadata
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump({
+            # Save metadata as compact orjson, lightly gzipped (level 1 costs
+            # far less CPU than the I/O it saves)
+            with gzip.open(metadata_path, 'wb', compresslevel=1) as f:
+                f.write(orjson.dumps({
                     'metadata': self.metadata,
                     'dimension': self.dimension,
                     'indexed_directory': self.indexed_directory,
-                }, f, indent=2)
+                    'embedding_model': self.embedding_model,
+                }))
             
             logger.info(f"Index saved: {index_name}")
             return True
@@ -381,21 +727,45 @@ class FileIndexer:
         """Load index and metadata from disk."""
         try:
             index_path = os.path.join(config.FAISS_INDEX_DIR, f"{index_name}.index")
-            metadata_path = os.path.join(config.METADATA_DIR, f"{index_name}.json")
+            metadata_path = os.path.join(config.METADATA_DIR, f"{index_name}.json.gz")
+            if not os.path.exists(metadata_path):
+                # Indexes saved before compression used plain JSON
+                metadata_path = os.path.join(config.METADATA_DIR, f"{index_name}.json")
             
             if not os.path.exists(index_path) or not os.path.exists(metadata_path):
                 logger.warning(f"Index not found: {index_name}")
                 return False
             
-            # Load FAISS index
-            self.index = faiss.read_index(index_path)
-            
             # Load metadata
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.metadata = data['metadata']
-                self.dimension = data['dimension']
-                self.indexed_directory = data.get('indexed_directory')
+            open_metadata = gzip.open if metadata_path.endswith('.gz') else open
+            with open_metadata(metadata_path, 'rb') as f:
+                data = orjson.loads(f.read())
+            
+            # Query vectors from another model would either fail FAISS's
+            # dimension check or be scored against unrelated document vectors
+            embedding_model = data.get('embedding_model')
+            if embedding_model is not None and embedding_model != self.ollama_client.embedding_model:
+                logger.warning(f"Index {index_name} was built with {embedding_model}, not "
+                               f"{self.ollama_client.embedding_model}; re-index to search it")
+                return False
+            
+            # Load FAISS index. With mmap, IVF inverted lists are paged in by
+            # the OS on demand and shared between processes via the page cache
+            if config.FAISS_MMAP_INDEX:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            else:
+                index = faiss.read_index(index_path)
+            if index.d != data['dimension'] or index.ntotal != len(data['metadata']):
+                logger.warning(f"Index {index_name} does not match its metadata, ignoring it")
+                return False
+            
+            self.index = index
+            self._mmap_path = index_path if config.FAISS_MMAP_INDEX else None
+            self.metadata = data['metadata']
+            self._unique_files = {meta['file_path'] for meta in self.metadata}
+            self.dimension = data['dimension']
+            self.indexed_directory = data.get('indexed_directory')
+            self.embedding_model = embedding_model
             
             logger.info(f"Index loaded: {index_name}")
             return True
@@ -404,13 +774,28 @@ class FileIndexer:
             logger.error(f"Error loading index: {e}")
             return False
     
-    def clear_index(self) -> bool:
-        """Clear current index."""
+    def clear_index(self, index_name: str = "default") -> bool:
+        """Clear current index and delete its saved files."""
         try:
+            # The saved index is loaded on startup, so it must go as well or
+            # the cleared index would come back on the next launch
+            for path in (
+                os.path.join(config.FAISS_INDEX_DIR, f"{index_name}.index"),
+                os.path.join(config.METADATA_DIR, f"{index_name}.json.gz"),
+                os.path.join(config.METADATA_DIR, f"{index_name}.json"),
+            ):
+                if os.path.exists(path):
+                    os.remove(path)
+            
             self.index = None
+            self._mmap_path = None
             self.metadata = []
+            self._unique_files = set()
             self.dimension = None
             self.indexed_directory = None
+            self.embedding_model = None
+            with self._query_cache_lock:
+                self._query_cache.clear()
             logger.info("Index cleared")
             return True
         except Exception as e:
@@ -426,12 +811,10 @@ class FileIndexer:
                 'total_files': 0,
             }
         
-        unique_files = len(set(m['file_path'] for m in self.metadata))
-        
         return {
             'indexed': True,
             'total_vectors': self.index.ntotal,
-            'total_files': unique_files,
+            'total_files': len(self._unique_files),
             'indexed_directory': self.indexed_directory,
             'dimension': self.dimension,
         }
@@ -1,17 +1,22 @@
 """FastAPI backend for NLP_Finder."""
 import os
+import asyncio
 import logging
 import platform
 import subprocess
-from typing import Optional
+from typing import List, Optional
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 
+# config must be imported before faiss so OMP_NUM_THREADS is in place
+import config
+import faiss
 from indexer import FileIndexer
 from utils.ollama_client import OllamaClient
-import config
+
+faiss.omp_set_num_threads(config.FAISS_NUM_THREADS)
 
 # Setup logging
 logging.basicConfig(
@@ -36,7 +41,9 @@ app.add_middleware(
 ollama_client = OllamaClient(
     config.OLLAMA_BASE_URL,
     config.EMBEDDING_MODEL,
-    config.LLM_MODEL
+    config.LLM_MODEL,
+    config.EMBED_MAX_WORKERS,
+    config.EMBED_MAX_TOKENS
 )
 indexer = FileIndexer(ollama_client)
 indexing_progress = {
@@ -48,6 +55,100 @@ indexing_progress = {
 }
 
 
+class SearchBatcher:
+    """Coalesces concurrent search requests into a single batched FAISS search."""
+    
+    def __init__(self, indexer: FileIndexer, max_batch: int, max_wait: float):
+        self.indexer = indexer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start the background batching task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the background batching task."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def search(self, query_embedding: List[float], top_k: int):
+        """Queue one query embedding and wait for its (distances, indices) row."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query_embedding, top_k, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a first query, then give others a short window to join
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                distances, indices = await asyncio.to_thread(
+                    self.indexer.search_vectors,
+                    [embedding for embedding, _, _ in batch],
+                    max(top_k for _, top_k, _ in batch)
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            # Results are sorted per row, so each query keeps its own top_k prefix
+            for row, (_, top_k, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result((distances[row][:top_k], indices[row][:top_k]))
+
+
+search_batcher = SearchBatcher(
+    indexer,
+    config.SEARCH_BATCH_SIZE,
+    config.SEARCH_BATCH_WAIT_MS / 1000
+)
+
+
+@app.on_event("startup")
+async def start_search_batcher():
+    """Start coalescing search requests."""
+    search_batcher.start()
+
+
+@app.on_event("startup")
+async def load_saved_index():
+    """Load the last saved index so re-indexing can skip unchanged files."""
+    await asyncio.to_thread(indexer.load_index)
+
+
+@app.on_event("shutdown")
+async def stop_search_batcher():
+    """Stop the search batching task."""
+    await search_batcher.stop()
+
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    """Release pooled Ollama connections."""
+    ollama_client.close()
+
+
 # Request/Response models
 class IndexRequest(BaseModel):
     directory: str
@@ -237,12 +338,24 @@ async def search_files(request: SearchRequest):
         raise HTTPException(status_code=503, detail="Ollama is not running or not accessible")
     
     try:
-        results = indexer.search(request.query, request.top_k)
+        top_k = request.top_k or config.TOP_K_RESULTS
+        
+        # Embed outside the batcher so slow Ollama calls never hold up a batch
+        query_embedding = await asyncio.to_thread(indexer.embed_query, request.query)
+        if query_embedding is None:
+            # The connection check above may be answered from a short-lived cache
+            raise HTTPException(status_code=503, detail="Failed to embed query; Ollama is not running or the embedding model is unavailable")
+        
+        distances, indices = await search_batcher.search(query_embedding, top_k)
+        results = await asyncio.to_thread(indexer.rank_results, request.query, distances, indices)
+        
         return {
             "query": request.query,
             "total_results": len(results),
             "results": results
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Search error: {e}")
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
@@ -280,6 +393,29 @@ async def get_file_preview(request: FilePreviewRequest):
         raise HTTPException(status_code=500, detail=f"Failed to preview file: {str(e)}")
 
 
+def _open_path(file_path: str, reveal: bool):
+    """Open file in the default app or reveal it; blocks until the launcher exits."""
+    system = platform.system()
+    
+    if reveal:
+        # Reveal file in file explorer
+        if system == "Windows":
+            subprocess.run(['explorer', '/select,', os.path.normpath(file_path)])
+        elif system == "Darwin":  # macOS
+            subprocess.run(['open', '-R', file_path])
+        else:  # Linux
+            # Open parent directory
+            subprocess.run(['xdg-open', os.path.dirname(file_path)])
+    else:
+        # Open file in default application
+        if system == "Windows":
+            os.startfile(file_path)
+        elif system == "Darwin":  # macOS
+            subprocess.run(['open', file_path])
+        else:  # Linux
+            subprocess.run(['xdg-open', file_path])
+
+
 @app.post("/file/open")
 async def open_file(request: OpenFileRequest):
     """Open file in system default app or reveal in file explorer."""
@@ -287,25 +423,8 @@ async def open_file(request: OpenFileRequest):
         raise HTTPException(status_code=404, detail="File not found")
     
     try:
-        system = platform.system()
-        
-        if request.reveal:
-            # Reveal file in file explorer
-            if system == "Windows":
-                subprocess.run(['explorer', '/select,', os.path.normpath(request.file_path)])
-            elif system == "Darwin":  # macOS
-                subprocess.run(['open', '-R', request.file_path])
-            else:  # Linux
-                # Open parent directory
-                subprocess.run(['xdg-open', os.path.dirname(request.file_path)])
-        else:
-            # Open file in default application
-            if system == "Windows":
-                os.startfile(request.file_path)
-            elif system == "Darwin":  # macOS
-                subprocess.run(['open', request.file_path])
-            else:  # Linux
-                subprocess.run(['xdg-open', request.file_path])
+        # Launchers can take 100+ ms to return; keep them off the event loop
+        await asyncio.to_thread(_open_path, request.file_path, request.reveal)
         
         return {"message": "File opened successfully"}
         
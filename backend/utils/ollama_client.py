@@ -1,39 +1,178 @@
 """Client for interacting with Ollama API."""
+import re
+import time
+import threading
+import orjson
 import requests
-from typing import List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Request bodies are pre-encoded with orjson, so the content type is set by hand
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Runs of ASCII word characters, or any single other non-space character
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_]+|\S')
+# Seconds a successful /api/tags listing is reused by the health checks
+_TAGS_TTL = 30.0
+# LLM-extracted snippets kept for repeated (query, document) pairs
+_SNIPPET_CACHE_SIZE = 1024
+# Words used to match query terms when picking snippets
+_WORD_RE = re.compile(r'\w+')
+# Common query words that say nothing about a snippet's relevance
+_STOPWORDS = frozenset({'the', 'and', 'for', 'how', 'what', 'where', 'which', 'with',
+                        'from', 'that', 'this', 'are', 'was', 'does', 'can'})
+
+
+def _has_json_error(body: bytes) -> bool:
+    """Whether a response body is an Ollama JSON error object."""
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return False
+    return isinstance(data, dict) and 'error' in data
+
+
+def _query_terms(query: str) -> set:
+    """Distinct query words worth matching in a snippet."""
+    return {word for word in _WORD_RE.findall(query.lower())
+            if len(word) > 2 and word not in _STOPWORDS}
+
+
+def _window_score(hits: List[Tuple[int, str]], start: int, max_length: int) -> int:
+    """Count the distinct terms whose hits lie wholly inside text[start:start + max_length]."""
+    end = start + max_length
+    return len({word for pos, word in hits if start <= pos and pos + len(word) <= end})
+
+
+def _best_window(terms: set, text: str, max_length: int) -> Tuple[str, int]:
+    """Find the max_length window of text containing the most distinct query terms."""
+    if not terms:
+        return '', 0
+    hits = []
+    for match in _WORD_RE.finditer(text):
+        word = match.group().lower()
+        if word in terms:
+            hits.append((match.start(), word))
+    if not hits:
+        return '', 0
+    
+    # Slide over hit positions; hits[i:j] all fall inside one window and
+    # counts holds how often each term occurs there
+    counts = {}
+    best_start, best_score, j = hits[0][0], 0, 0
+    for start, word in hits:
+        while j < len(hits) and hits[j][0] < start + max_length:
+            counts[hits[j][1]] = counts.get(hits[j][1], 0) + 1
+            j += 1
+        if len(counts) > best_score:
+            best_start, best_score = start, len(counts)
+        counts[word] -= 1
+        if not counts[word]:
+            del counts[word]
+    
+    # Begin at the start of the sentence holding the first hit when it is
+    # close, unless moving the window back drops terms off its end
+    boundary = text.rfind('. ', max(0, best_start - max_length // 3), best_start)
+    if boundary != -1 and _window_score(hits, boundary + 2, max_length) == best_score:
+        best_start = boundary + 2
+    end = best_start + max_length
+    snippet = text[best_start:end].strip()
+    return (snippet + "..." if end < len(text) else snippet), _window_score(hits, best_start, max_length)
+
 
 class OllamaClient:
     """Client for Ollama API operations."""
     
-    def __init__(self, base_url: str, embedding_model: str, llm_model: str):
+    def __init__(self, base_url: str, embedding_model: str, llm_model: str, max_workers: int = 4,
+                 max_tokens: int = 2048):
         self.base_url = base_url.rstrip('/')
         self.embedding_model = embedding_model
         self.llm_model = llm_model
+        # Embedding inputs are cut to roughly this many tokens
+        self.max_tokens = max_tokens
+        # Bounded pool for concurrent embedding requests
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        
+        # Pooled keep-alive connections shared by all calls, with a short
+        # retry on transient overload responses
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=max(16, max_workers),
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.1,
+                status_forcelist=[429, 502, 503],
+                allowed_methods=frozenset({'GET', 'POST'})
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Cleared the first time the server answers /api/embed with 404
+        self._batch_embed_supported = True
+        # (models, expiry) from the last successful /api/tags call; dropped
+        # as soon as any request fails to connect
+        self._tag_cache = (None, 0.0)
+        # (llm model, query, context, max_length) -> LLM snippet, in LRU order
+        self._snippet_cache: OrderedDict = OrderedDict()
+        self._snippet_cache_lock = threading.Lock()
     
-    def check_connection(self) -> bool:
-        """Check if Ollama is running and accessible."""
+    def _truncate_to_tokens(self, text: str) -> str:
+        """Cut text to about max_tokens tokens using a cheap BPE-style estimate."""
+        # Every estimated token spans at least one character
+        if len(text) <= self.max_tokens:
+            return text
+        
+        tokens = 0
+        for match in _TOKEN_RE.finditer(text):
+            piece = match.group()
+            # ASCII words cost ~1 token per 4 chars; other symbols (CJK,
+            # punctuation) ~1 token each
+            tokens += (len(piece) + 3) // 4 if piece.isascii() and len(piece) > 1 else 1
+            if tokens > self.max_tokens:
+                return text[:match.start()]
+        return text
+    
+    def close(self):
+        """Release pooled connections and worker threads."""
+        self._executor.shutdown(wait=False)
+        self.session.close()
+    
+    def _get_tags(self) -> Optional[List[dict]]:
+        """Return the installed models from /api/tags, or None if Ollama is unreachable."""
+        models, expiry = self._tag_cache
+        if models is not None and time.monotonic() < expiry:
+            return models
+        
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except requests.exceptions.RequestException as e:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
+            if response.status_code == 200:
+                models = orjson.loads(response.content).get('models', [])
+                self._tag_cache = (models, time.monotonic() + _TAGS_TTL)
+                return models
+            logger.error(f"Failed to list Ollama models: {response.status_code}")
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Failed to connect to Ollama: {e}")
-            return False
+        
+        # Failures are never cached so the next check retries immediately
+        self._tag_cache = (None, 0.0)
+        return None
+    
+    def check_connection(self) -> bool:
+        """Check if Ollama is running and accessible."""
+        return self._get_tags() is not None
     
     def check_model(self, model_name: str) -> bool:
         """Check if a model is available in Ollama."""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                return any(model['name'].startswith(model_name) for model in models)
-            return False
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to check model availability: {e}")
+        models = self._get_tags()
+        if models is None:
             return False
+        return any(model['name'].startswith(model_name) for model in models)
     
     def embed_text(self, text: str, model: Optional[str] = None) -> Optional[List[float]]:
         """Generate embeddings for text using Ollama."""
@@ -41,55 +180,127 @@ class OllamaClient:
             model = self.embedding_model
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/embeddings",
-                json={
+                data=orjson.dumps({
                     "model": model,
                     "prompt": text
-                },
+                }),
+                headers=_JSON_HEADERS,
                 timeout=15  # Reduced timeout to prevent long hangs
             )
             
             if response.status_code == 200:
-                return response.json().get('embedding')
+                return orjson.loads(response.content).get('embedding')
             else:
                 logger.error(f"Embedding failed: {response.status_code} - {response.text}")
                 return None
         except requests.exceptions.Timeout:
             logger.error(f"Embedding request timed out after 15 seconds")
             return None
-        except requests.exceptions.RequestException as e:
+        except requests.exceptions.ConnectionError as e:
+            self._tag_cache = (None, 0.0)
+            logger.error(f"Failed to connect to Ollama: {e}")
+            return None
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Failed to generate embedding: {e}")
             return None
     
+    def _embed_slice(self, texts_slice: List[str], model: str) -> Optional[List[Optional[List[float]]]]:
+        """POST one slice of texts to /api/embed; None means the endpoint is unsupported."""
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/embed",
+                data=orjson.dumps({
+                    "model": model,
+                    "input": texts_slice
+                }),
+                headers=_JSON_HEADERS,
+                timeout=60
+            )
+            
+            # Old servers answer the unknown route with a plain-text 404; a
+            # JSON error (e.g. model not pulled yet) is an ordinary failure
+            if response.status_code == 404 and not _has_json_error(response.content):
+                return None
+            
+            if response.status_code == 200:
+                batch_embeddings = orjson.loads(response.content).get('embeddings') or []
+                if len(batch_embeddings) == len(texts_slice):
+                    return batch_embeddings
+                logger.error(f"Batch embedding returned {len(batch_embeddings)} vectors for {len(texts_slice)} texts")
+            else:
+                logger.error(f"Batch embedding failed: {response.status_code} - {response.text}")
+        except requests.exceptions.ConnectionError as e:
+            self._tag_cache = (None, 0.0)
+            logger.error(f"Failed to connect to Ollama: {e}")
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.error(f"Failed to generate batch embeddings: {e}")
+        
+        return [None] * len(texts_slice)
+    
+    def embed_batch_native(self, texts: List[str], model: Optional[str] = None,
+                           batch_size: int = 64) -> Optional[List[Optional[List[float]]]]:
+        """Embed texts with Ollama's batched /api/embed endpoint.
+        
+        Slices are sent concurrently on the client's thread pool. Returns None
+        if the server does not support /api/embed (older Ollama).
+        """
+        if not model:
+            model = self.embedding_model
+        
+        futures = [
+            self._executor.submit(self._embed_slice, texts[start:start + batch_size], model)
+            for start in range(0, len(texts), batch_size)
+        ]
+        
+        embeddings = []
+        for future in futures:
+            batch_embeddings = future.result()
+            if batch_embeddings is None:
+                logger.warning("Ollama does not support /api/embed, falling back to per-text embeddings")
+                self._batch_embed_supported = False
+                return None
+            embeddings.extend(batch_embeddings)
+        
+        return embeddings
+    
     def embed_batch(self, texts: List[str], model: Optional[str] = None) -> List[Optional[List[float]]]:
         """Generate embeddings for multiple texts."""
         if not model:
             model = self.embedding_model
         
-        embeddings = []
-        for i, text in enumerate(texts):
+        # Truncate very long texts to the model's context to avoid timeouts
+        truncated_texts = [self._truncate_to_tokens(text) for text in texts]
+        
+        if self._batch_embed_supported:
+            embeddings = self.embed_batch_native(truncated_texts, model)
+            if embeddings is not None:
+                return embeddings
+        
+        # Per-text fallback, still overlapping round-trips on the thread pool
+        embeddings = [None] * len(truncated_texts)
+        future_to_idx = {
+            self._executor.submit(self.embed_text, text, model): i
+            for i, text in enumerate(truncated_texts)
+        }
+        
+        for done_count, future in enumerate(as_completed(future_to_idx), start=1):
+            i = future_to_idx[future]
             try:
-                # Truncate very long texts to avoid timeouts
-                max_length = 8000  # Reasonable limit for embedding
-                truncated_text = text[:max_length] if len(text) > max_length else text
-                
-                embedding = self.embed_text(truncated_text, model)
-                embeddings.append(embedding)
-                
-                # Log progress for large batches
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Embedded {i + 1}/{len(texts)} chunks")
-                    
+                embeddings[i] = future.result()
             except Exception as e:
                 logger.error(f"Error embedding text {i + 1}: {e}")
-                embeddings.append(None)
+            
+            # Log progress for large batches
+            if done_count % 10 == 0:
+                logger.info(f"Embedded {done_count}/{len(texts)} chunks")
         
         return embeddings
     
     def generate_completion(self, prompt: str, model: Optional[str] = None, 
                           system: Optional[str] = None) -> Optional[str]:
-        """Generate text completion using Ollama LLM."""
+        """Generate text completion using Ollama LLM, streaming tokens as they arrive."""
         if not model:
             model = self.llm_model
         
@@ -97,40 +308,78 @@ class OllamaClient:
             payload = {
                 "model": model,
                 "prompt": prompt,
-                "stream": False
+                "stream": True
             }
             
             if system:
                 payload["system"] = system
             
-            response = requests.post(
+            with self.session.post(
                 f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                return response.json().get('response')
-            else:
-                logger.error(f"Completion failed: {response.status_code} - {response.text}")
-                return None
-        except requests.exceptions.RequestException as e:
+                data=orjson.dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=60,
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f"Completion failed: {response.status_code} - {response.text}")
+                    return None
+                
+                # Ollama streams one JSON object per line until done=true
+                parts = []
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    if 'error' in chunk:
+                        logger.error(f"Completion failed: {chunk['error']}")
+                        return None
+                    parts.append(chunk.get('response', ''))
+                    if chunk.get('done'):
+                        break
+                
+                return ''.join(parts)
+        except requests.exceptions.ConnectionError as e:
+            self._tag_cache = (None, 0.0)
+            logger.error(f"Failed to connect to Ollama: {e}")
+            return None
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Failed to generate completion: {e}")
             return None
     
     def extract_snippet(self, query: str, text: str, max_length: int = 300) -> str:
-        """Extract relevant snippet from text using LLM."""
+        """Extract relevant snippet from text, asking the LLM only for weak keyword matches."""
+        terms = _query_terms(query)
+        snippet, score = _best_window(terms, text[:2000], max_length)
+        # Good enough when at least half the query terms appear in the window
+        if snippet and score * 2 >= len(terms):
+            return snippet
+        
+        context = text[:2000]
+        cache_key = (self.llm_model, query, context, max_length)
+        with self._snippet_cache_lock:
+            cached = self._snippet_cache.get(cache_key)
+            if cached is not None:
+                self._snippet_cache.move_to_end(cache_key)
+                return cached
+        
         prompt = f"""Given this search query: "{query}"
 
 Extract the most relevant snippet (max {max_length} characters) from the following text:
 
-{text[:2000]}
+{context}
 
 Return ONLY the extracted snippet, nothing else."""
         
         snippet = self.generate_completion(prompt)
         if snippet and len(snippet) <= max_length * 1.5:
-            return snippet.strip()
+            snippet = snippet.strip()
+            # Only LLM answers are cached; failures retry on the next call
+            with self._snippet_cache_lock:
+                self._snippet_cache[cache_key] = snippet
+                if len(self._snippet_cache) > _SNIPPET_CACHE_SIZE:
+                    self._snippet_cache.popitem(last=False)
+            return snippet
         
         # Fallback to simple extraction
         return text[:max_length] + "..." if len(text) > max_length else text